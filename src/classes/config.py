@@ -11,6 +11,11 @@ from todoist_api_override.api import (
     TodoistAPIPatched as TodoistAPI,
 )
 from gcsa.google_calendar import GoogleCalendar
+from gcsa.util.date_time_util import to_localized_iso
+
+from classes.event_cache import EventCache
+from classes.fetch_tier import FetchTier
+from helpers.decorators import RequestBudget
 
 
 logger = logging.getLogger()
@@ -30,9 +35,19 @@ class Config:
         self.completed_label = None
 
         self.days_to_fetch = None
+        self.fetch_tiers = None
+
+        self.backfill_chunk_days = None
+        self.requests_per_minute = None
+        self.request_budget = None
+
+        self.memory_snapshot_every = None
+        self.soak_test_cycles = None
+        self.soak_test_max_growth = None
 
         self.todoist_token = None
         self.todoist = None
+        self.google_calendar = None
 
         configs_path = "configs/configs.yml"
         if os.path.isfile(configs_path):
@@ -48,23 +63,77 @@ class Config:
         self.mother_project_name = data.get("default_project", "Events")
         self.label = data.get("label", "Event")
         self.keep_running = data.get("keep_running", True)
-        self.run_every = data.get("run_every", 300)
+        self.run_every = int(data.get("run_every", 300))
         self.task_prefix = data.get("task_prefix", "* 🗓️ ```")
         self.task_suffix = data.get("task_suffix", "```")
         self.completed_label = data.get("completed_label", "Done")
-        self.days_to_fetch = data.get("days_to_fetch", "7")
+        self.days_to_fetch = int(data.get("days_to_fetch", 7))
+        self.fetch_tiers = self.parse_fetch_tiers(data.get("fetch_tiers"))
+        self.backfill_chunk_days = int(data.get("backfill_chunk_days", 0))
+        self.requests_per_minute = int(data.get("requests_per_minute", 0))
+        self.request_budget = RequestBudget(
+            requests_per_minute=self.requests_per_minute
+        )
+
+        self.memory_snapshot_every = int(data.get("memory_snapshot_every", 0))
+        self.soak_test_cycles = int(data.get("soak_test_cycles", 0))
+        self.soak_test_max_growth = float(data.get("soak_test_max_growth", 10))
+
+    def connect(
+        self,
+        todoist: TodoistAPI | None = None,
+        google_calendar: GoogleCalendar | None = None,
+    ) -> None:
+        """Set up the API clients, the ones not given are created from the configs"""
 
-        if not self.todoist_token:
-            raise Exception("Todoist token not set.")
+        if not todoist:
+            if not self.todoist_token:
+                raise Exception("Todoist token not set.")
 
-        self.todoist = TodoistAPI(self.todoist_token)
+            todoist = TodoistAPI(self.todoist_token)
+
+        self.todoist = todoist
+        self.google_calendar = google_calendar
 
         self.fetch_mother_project_id()
 
+    def parse_fetch_tiers(self, tiers: list[dict] | str | None) -> list[FetchTier]:
+        """Build the fetch tiers, falling back to a single days_to_fetch tier refreshed every run"""
+
+        if not tiers:
+            return [
+                FetchTier(
+                    index=0, start_day=0, end_day=self.days_to_fetch, refresh_every=0
+                )
+            ]
+
+        if isinstance(tiers, str):  # Set through an environment variable
+            tiers = yaml.safe_load(tiers)
+
+        fetch_tiers = []
+        start_day = 0
+        for index, tier in enumerate(tiers):
+            end_day = int(tier["days"])
+            if end_day <= start_day:
+                raise Exception("fetch_tiers days must be in ascending order.")
+
+            fetch_tiers.append(
+                FetchTier(
+                    index=index,
+                    start_day=start_day,
+                    end_day=end_day,
+                    refresh_every=int(tier.get("refresh_every", 0)),
+                )
+            )
+            start_day = end_day
+
+        return fetch_tiers
+
     def fetch_mother_project_id(self) -> None:
         """Fetch the default_project ID from Todoist and set it as an attribute"""
 
         logger.info("Fetching mother project-id")
+        self.request_budget.wait()
         matching_projects = [
             project
             for project in self.todoist.get_projects()
@@ -75,6 +144,7 @@ class Config:
                 0
             ].id  # Always return the first project listed by Todoist
         else:
+            self.request_budget.wait()
             new_project = self.todoist.add_project(self.mother_project_name)
             proj_id = new_project.id
 
@@ -85,32 +155,54 @@ class Config:
     def get_calendars(self) -> tuple[str, str]:
         """Search for Todoist projects with a calendar comment and yield them"""
 
+        self.request_budget.wait()
         for todoist_project_id in [
             x.id
             for x in self.todoist.get_projects()
             if x.parent_id == self.mother_project_id and x.comment_count >= 1
         ]:
+            self.request_budget.wait()
             gcal_calendar_id = self.todoist.get_comments(project_id=todoist_project_id)[
                 0
             ].content
 
             yield todoist_project_id, gcal_calendar_id
 
-    def get_calendar_events(self, gcal_id: str) -> Iterator[Event]:
-        """Yield events from a calendar"""
-
-        gc = GoogleCalendar(
-            gcal_id, credentials_path=".credentials/credentials.json"
-        ).get_events(
-            time_min=datetime.datetime.today(),
-            time_max=datetime.datetime.today()
-            + datetime.timedelta(
-                days=self.days_to_fetch,
-            ),
-            single_events=True,
-        )
-
-        logger.info(f'Getting calendar: "{gcal_id}"')
-
-        for event in list(gc):
-            yield event
+    def get_calendar_events(
+        self,
+        gcal_id: str,
+        time_min: datetime.datetime,
+        time_max: datetime.datetime,
+        event_cache: EventCache,
+    ) -> Iterator[Event]:
+        """Yield events from a calendar within a time window, events already parsed on this run are reused"""
+
+        if not self.google_calendar:
+            # A single client is kept for the lifetime of the process instead of building one per fetch
+            self.google_calendar = GoogleCalendar(
+                credentials_path=".credentials/credentials.json"
+            )
+
+        logger.info(f'Getting calendar: "{gcal_id}" ({time_min} - {time_max})')
+
+        # Events are listed as JSON so the ones shared with other calendars are only parsed once
+        page_token = None
+        while True:
+            response = (
+                self.google_calendar.service.events()
+                .list(
+                    calendarId=gcal_id,
+                    timeMin=to_localized_iso(time_min),
+                    timeMax=to_localized_iso(time_max),
+                    singleEvents=True,
+                    pageToken=page_token,
+                )
+                .execute()
+            )
+
+            for event_json in response["items"]:
+                yield event_cache.get_event(event_json)
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
@@ -0,0 +1,74 @@
+from typing import Callable
+
+from gcsa.event import Event
+from gcsa.serializers.event_serializer import EventSerializer
+
+
+class EventCache:
+    def __init__(self):
+        self.events = {}
+        self.renders = {}
+
+        self.parses_saved = 0
+        self.renders_saved = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.parses_saved} event parses and {self.renders_saved} renders saved"
+        )
+
+    @staticmethod
+    def get_json_key(event_json: dict) -> tuple | None:
+        ical_uid = event_json.get("iCalUID")
+        updated = event_json.get("updated")
+        if not ical_uid or not updated:
+            return None
+
+        # Instances of a recurring event share their iCalUID, tell them apart by their start
+        start = event_json.get("start", {})
+        return ical_uid, start.get("dateTime") or start.get("date"), updated
+
+    @staticmethod
+    def get_key(event: Event) -> tuple | None:
+        ical_uid = event.other.get("iCalUID")
+        if not ical_uid or not event.updated:
+            return None
+
+        return ical_uid, event.start, event.updated
+
+    def get_event(self, event_json: dict) -> Event:
+        """Parse an event listed by the API, unless the same event was already parsed on this run"""
+
+        key = self.get_json_key(event_json)
+
+        cached_event = self.events.get(key) if key else None
+        if cached_event and cached_event.event_id == event_json.get("id"):
+            self.parses_saved += 1
+            return cached_event
+
+        event = EventSerializer.to_object(event_json)
+        if key:
+            self.events.setdefault(key, event)
+
+        return event
+
+    def get_render(self, event: Event, render: Callable[[], tuple]) -> tuple:
+        """Return the cached render of an event, calling render on the first request"""
+
+        key = self.get_key(event)
+        if not key:
+            return render()
+
+        if key in self.renders:
+            self.renders_saved += 1
+        else:
+            self.renders[key] = render()
+
+        return self.renders[key]
+
+    def clear(self) -> None:
+        self.events.clear()
+        self.renders.clear()
+
+        self.parses_saved = 0
+        self.renders_saved = 0
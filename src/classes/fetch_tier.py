@@ -0,0 +1,47 @@
+import datetime
+
+
+class FetchTier:
+    def __init__(self, index: int, start_day: int, end_day: int, refresh_every: int):
+        self.index = index
+
+        self.start_day = start_day
+        self.end_day = end_day
+        self.refresh_every = refresh_every
+
+        self.last_refresh = None
+
+    def __str__(self) -> str:
+        return f"{self.index} (days {self.start_day}-{self.end_day})"
+
+    def is_due(self, run_id: int) -> bool:
+        """Whether this tier should be fetched on the run identified by run_id"""
+
+        return (
+            self.last_refresh is None
+            or run_id - self.last_refresh >= self.refresh_every
+        )
+
+    def get_time_window(
+        self, now: datetime.datetime, until: datetime.datetime | None = None
+    ) -> tuple[datetime.datetime, datetime.datetime]:
+        """Return the tier's time window starting from now, cut short at until if set"""
+
+        time_max = now + datetime.timedelta(days=self.end_day)
+
+        if until:
+            time_max = min(time_max, until)
+
+        return now + datetime.timedelta(days=self.start_day), time_max
+
+    def covers(
+        self,
+        due_date: datetime.datetime,
+        now: datetime.datetime,
+        until: datetime.datetime | None = None,
+    ) -> bool:
+        """Whether due_date falls in the window fetched at now, the first tier also covering everything already past"""
+
+        time_min, time_max = self.get_time_window(now=now, until=until)
+
+        return due_date < time_max and (self.start_day == 0 or due_date >= time_min)
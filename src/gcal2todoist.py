@@ -2,10 +2,15 @@ from time import gmtime
 import datetime
 import logging
 import calendar
+import gc
 
 from helpers.db import DB
-from helpers.decorators import retry, keep_running
+from helpers.decorators import retry, keep_running, throttle
+from helpers.fakes import FakeGoogleCalendar, FakeTodoistAPI
+from helpers.memory import MemoryMonitor, soak_test
 from classes.config import Config
+from classes.event_cache import EventCache
+from classes.fetch_tier import FetchTier
 
 # from todoist_api_python.api import Task
 from todoist_api_override.api import (
@@ -28,7 +33,16 @@ logger.setLevel(logging.INFO)
 
 
 configs = Config()
-db = DB()
+db = DB(in_memory=bool(configs.soak_test_cycles))
+
+memory_monitor = MemoryMonitor(snapshot_every=configs.memory_snapshot_every)
+event_cache = EventCache()
+
+# Tiers are refreshed at their own pace across restarts and one-shot runs
+for fetch_tier in configs.fetch_tiers:
+    fetch_tier.last_refresh = db.get_tier_refresh(
+        start_day=fetch_tier.start_day, end_day=fetch_tier.end_day
+    )
 
 
 class TodoistTask:
@@ -44,8 +58,10 @@ class TodoistTask:
     ):
         self.event = event
 
-        self.task_name = self.generate_task_name()
-        self.note = self.generate_note()
+        # Events shared between calendars are only rendered once per run
+        self.task_name, self.note = event_cache.get_render(
+            event, lambda: (self.generate_task_name(), self.generate_note())
+        )
 
         self.date = date
         self.duration = duration
@@ -127,7 +143,10 @@ class TodoistTask:
         )
 
         db.update_todoist_id(
-            todoist_id=task.id, event_id=self.event.event_id, event_index=self.index
+            todoist_id=task.id,
+            gcal_id=self.gcal_id,
+            event_id=self.event.event_id,
+            event_index=self.index,
         )
 
     def update(self, existing_tasks: list[Task]) -> None:
@@ -147,7 +166,10 @@ class TodoistTask:
                 logger.info("- Forcefully completing labeled task")
                 close_task(task_id=self.todoist_id)
                 db.update_todoist_status(
-                    completed=True, event_id=self.event.event_id, event_index=self.index
+                    completed=True,
+                    gcal_id=self.gcal_id,
+                    event_id=self.event.event_id,
+                    event_index=self.index,
                 )
 
             elif (
@@ -257,89 +279,297 @@ def should_add_based_on_event(event: Event, gcal_id: str) -> bool:
 
 
 @retry()
+@throttle(configs.request_budget)
 def delete_task(task_id: str) -> None:
     configs.todoist.delete_task(task_id=task_id)
 
 
 @retry()
+@throttle(configs.request_budget)
 def get_tasks(project_id: str) -> list[Task]:
     return configs.todoist.get_tasks(project_id=project_id)
 
 
 @retry()
+@throttle(configs.request_budget)
 def add_task(*args, **kwargs) -> Task:
     return configs.todoist.add_task(*args, **kwargs)
 
 
 @retry()
+@throttle(configs.request_budget)
 def update_task(*args, **kwargs) -> None:
     configs.todoist.update_task(*args, **kwargs)
 
 
 @retry()
+@throttle(configs.request_budget)
 def close_task(task_id: str) -> None:
     configs.todoist.close_task(task_id=task_id)
 
 
-@keep_running(one_shot=not configs.keep_running, delay=configs.run_every)
-def run() -> None:
-    run_id = calendar.timegm(gmtime())
-    logger.info(f"Run {run_id}")
+def handle_event(
+    event: Event,
+    gcal_id: str,
+    todoist_project_id: str,
+    existing_tasks: list[Task],
+    run_id: int,
+) -> None:
+    for date, duration, index in generate_date_range(event):
+        logger.info(f"Handling task '{event.summary}'[{index}]")
 
-    for todoist_project_id, gcal_id in configs.get_calendars():
-        existing_tasks = get_tasks(project_id=todoist_project_id)
+        if not should_add_based_on_event(event=event, gcal_id=gcal_id):
+            logger.info("- Skipping due to event")
+            continue
 
-        for event in configs.get_calendar_events(gcal_id=gcal_id):
-            for date, duration, index in generate_date_range(event):
-                logger.info(f"Handling task '{event.summary}'[{index}]")
+        if not should_add_based_on_date(date, duration=duration):
+            logger.info("- Skipping due to date")
+            continue
 
-                if not should_add_based_on_event(event=event, gcal_id=gcal_id):
-                    logger.info("- Skipping due to event")
-                    continue
+        db.insert_or_update_without_todoist(
+            gcal_id=gcal_id,
+            event_id=event.event_id,
+            due_date=date,
+            event_index=index,
+            run_id=run_id,
+        )
 
-                if not should_add_based_on_date(date, duration=duration):
-                    logger.info("- Skipping due to date")
-                    continue
+        db_event = db.get_event(
+            gcal_id=gcal_id, event_id=event.event_id, event_index=index
+        )
 
-                db.insert_or_update_without_todoist(
-                    event_id=event.event_id,
-                    due_date=date,
-                    event_index=index,
-                    run_id=run_id,
+        if db_event and db_event.get("todoist_id"):
+            if not db_event.get("completed"):
+                existing_task = TodoistTask(
+                    event=event,
+                    date=date,
+                    duration=duration,
+                    index=index,
+                    gcal_id=gcal_id,
+                    todoist_project_id=todoist_project_id,
+                    todoist_id=db_event.get("todoist_id"),
                 )
+                existing_task.update(existing_tasks=existing_tasks)
+            else:
+                logger.info("- Task is considered done.")
+
+        else:
+            logger.info("- Adding task")
+            new_task = TodoistTask(
+                event=event,
+                date=date,
+                duration=duration,
+                index=index,
+                gcal_id=gcal_id,
+                todoist_project_id=todoist_project_id,
+            )
+            new_task.add()
+
+
+def parse_due_date(due_date: str) -> datetime.datetime:
+    """Parse a due_date stored on the DB as a naive local datetime, like the fetch windows"""
+
+    date = parse(due_date)
+    if date.tzinfo:
+        date = date.astimezone().replace(tzinfo=None)
+
+    return date
+
+
+def get_backfill_checkpoints(
+    calendars: list[tuple[str, str]],
+) -> dict[str, datetime.date]:
+    """Return up to which date each calendar has been synced, near-term days are always considered synced"""
+
+    today = datetime.date.today()
+    near_term = today + datetime.timedelta(
+        days=min(configs.fetch_tiers[0].end_day, configs.backfill_chunk_days)
+    )
+
+    # Checkpoints of calendars that are no longer mapped would keep is_backfill_pending() true forever
+    db.delete_backfill_checkpoints(
+        excluding_gcal_ids=[gcal_id for _, gcal_id in calendars]
+    )
+
+    checkpoints = {}
+    for _, gcal_id in calendars:
+        checkpoint = db.get_backfill_checkpoint(gcal_id=gcal_id)
+        checkpoints[gcal_id] = max(checkpoint, near_term) if checkpoint else near_term
+
+    return checkpoints
+
+
+def is_backfill_pending() -> bool:
+    """Whether a calendar with a saved checkpoint still has days left to backfill"""
+
+    if not configs.backfill_chunk_days:
+        return False
+
+    # Calendars without a checkpoint yet are picked up by the next tier refresh
+    horizon = datetime.date.today() + datetime.timedelta(
+        days=configs.fetch_tiers[-1].end_day
+    )
+
+    return any(checkpoint < horizon for checkpoint in db.get_backfill_checkpoints())
+
+
+def backfill(
+    todoist_project_id: str,
+    gcal_id: str,
+    checkpoint: datetime.date,
+    handled_events: set,
+    run_id: int,
+) -> datetime.date:
+    """Sync the chunk of days following checkpoint and return the new checkpoint"""
+
+    today = datetime.date.today()
+    horizon = today + datetime.timedelta(days=configs.fetch_tiers[-1].end_day)
+    chunk_end = min(
+        checkpoint + datetime.timedelta(days=configs.backfill_chunk_days), horizon
+    )
+
+    if checkpoint >= chunk_end:
+        return checkpoint
+
+    logger.info(f'Backfilling "{gcal_id}" from {checkpoint} to {chunk_end}')
+
+    existing_tasks = get_tasks(project_id=todoist_project_id)
+
+    for event in configs.get_calendar_events(
+        gcal_id=gcal_id,
+        time_min=max(
+            datetime.datetime.today(),
+            datetime.datetime.combine(checkpoint, datetime.time.min),
+        ),
+        time_max=datetime.datetime.combine(chunk_end, datetime.time.min),
+        event_cache=event_cache,
+    ):
+        if event.event_id in handled_events:
+            continue
+        handled_events.add(event.event_id)
+
+        handle_event(
+            event=event,
+            gcal_id=gcal_id,
+            todoist_project_id=todoist_project_id,
+            existing_tasks=existing_tasks,
+            run_id=run_id,
+        )
+
+    db.set_backfill_checkpoint(gcal_id=gcal_id, synced_until=chunk_end)
 
-                db_event = db.get_event(event_id=event.event_id, event_index=index)
-
-                if db_event and db_event.get("todoist_id"):
-                    if not db_event.get("completed"):
-                        existing_task = TodoistTask(
-                            event=event,
-                            date=date,
-                            duration=duration,
-                            index=index,
-                            gcal_id=gcal_id,
-                            todoist_project_id=todoist_project_id,
-                            todoist_id=db_event.get("todoist_id"),
-                        )
-                        existing_task.update(existing_tasks=existing_tasks)
-                    else:
-                        logger.info("- Task is considered done.")
-
-                else:
-                    logger.info("- Adding task")
-                    new_task = TodoistTask(
-                        event=event,
-                        date=date,
-                        duration=duration,
-                        index=index,
-                        gcal_id=gcal_id,
-                        todoist_project_id=todoist_project_id,
-                    )
-                    new_task.add()
+    return chunk_end
+
+
+def refresh(
+    todoist_project_id: str,
+    gcal_id: str,
+    tiers: list[FetchTier],
+    now: datetime.datetime,
+    until: datetime.datetime | None,
+    handled_events: set,
+    run_id: int,
+) -> None:
+    """Sync the events of a calendar within the windows of the given tiers"""
+
+    existing_tasks = get_tasks(project_id=todoist_project_id)
+
+    for tier in tiers:
+        time_min, time_max = tier.get_time_window(now=now, until=until)
+        if time_min >= time_max:
+            continue
+
+        for event in configs.get_calendar_events(
+            gcal_id=gcal_id,
+            time_min=time_min,
+            time_max=time_max,
+            event_cache=event_cache,
+        ):
+            # Events crossing a tier boundary are returned by both tiers
+            if event.event_id in handled_events:
+                continue
+            handled_events.add(event.event_id)
+
+            handle_event(
+                event=event,
+                gcal_id=gcal_id,
+                todoist_project_id=todoist_project_id,
+                existing_tasks=existing_tasks,
+                run_id=run_id,
+            )
+
+
+def sync(run_id: int) -> None:
+    tiers = [tier for tier in configs.fetch_tiers if tier.is_due(run_id=run_id)]
+    if not tiers and not is_backfill_pending():
+        logger.info("No fetch tier is due for a refresh")
+        return
+
+    # Windows are computed from the same moment for fetching and cleanup so they match exactly
+    now = datetime.datetime.today()
+
+    calendars = list(configs.get_calendars())
+    handled_events = {gcal_id: set() for _, gcal_id in calendars}
+
+    checkpoints = {}
+    if configs.backfill_chunk_days:
+        checkpoints = get_backfill_checkpoints(calendars=calendars)
+
+    if tiers:
+        logger.info(f"Refreshing tiers: {', '.join(str(tier) for tier in tiers)}")
+
+        for todoist_project_id, gcal_id in calendars:
+            # Days past the backfill checkpoint are left to backfill()
+            until = None
+            if gcal_id in checkpoints:
+                until = datetime.datetime.combine(
+                    checkpoints[gcal_id], datetime.time.min
+                )
+
+            refresh(
+                todoist_project_id=todoist_project_id,
+                gcal_id=gcal_id,
+                tiers=tiers,
+                now=now,
+                until=until,
+                handled_events=handled_events[gcal_id],
+                run_id=run_id,
+            )
+
+    if configs.backfill_chunk_days:
+        # A single chunk per calendar is synced on each run, after every calendar got its near-term events
+        for todoist_project_id, gcal_id in calendars:
+            checkpoints[gcal_id] = backfill(
+                todoist_project_id=todoist_project_id,
+                gcal_id=gcal_id,
+                checkpoint=checkpoints[gcal_id],
+                handled_events=handled_events[gcal_id],
+                run_id=run_id,
+            )
+
+    if not tiers:
+        return
 
     logger.info("Starting cleanup")
 
     for entry in db.get_unattached_events(run_id=run_id):
+        # Entries past their calendar's backfill checkpoint haven't been fetched yet, so they can't be considered
+        # stale. Entries saved without a calendar fall back to the lowest checkpoint.
+        backfilled_until = None
+        if checkpoints:
+            checkpoint = checkpoints.get(
+                entry.get("gcal_id"), min(checkpoints.values())
+            )
+            backfilled_until = datetime.datetime.combine(checkpoint, datetime.time.min)
+
+        # Only entries due within the windows refreshed on this run can be considered stale
+        due_date = parse_due_date(entry["due_date"])
+        if not any(
+            tier.covers(due_date=due_date, now=now, until=backfilled_until)
+            for tier in tiers
+        ):
+            continue
+
         # Delete all DB entries that weren't updated with the current run_id because they've either become stale or
         # unattached somehow
         if entry.get("todoist_id"):
@@ -347,6 +577,58 @@ def run() -> None:
 
         db.delete_event(entry.doc_id)
 
+    for tier in tiers:
+        tier.last_refresh = run_id
+        db.set_tier_refresh(
+            start_day=tier.start_day, end_day=tier.end_day, last_refresh=run_id
+        )
+
+
+def run_once(run_id: int) -> None:
+    logger.info(f"Run {run_id}")
+
+    try:
+        sync(run_id=run_id)
+    finally:
+        logger.info(f"Event cache: {event_cache}")
+
+        # Release everything the run held on to before the process goes back to sleep
+        event_cache.clear()
+        db.clear_cache()
+        gc.collect()
+        memory_monitor.after_run()
+
+
+@keep_running(one_shot=not configs.keep_running, delay=configs.run_every)
+def run() -> None:
+    run_once(run_id=calendar.timegm(gmtime()))
+
+
+def soak() -> None:
+    configs.connect(
+        todoist=FakeTodoistAPI(
+            mother_project_name=configs.mother_project_name,
+            completed_label=configs.completed_label,
+        ),
+        google_calendar=FakeGoogleCalendar(),
+    )
+
+    first_run_id = calendar.timegm(gmtime())
+
+    passed = soak_test(
+        # Simulate run_every seconds between cycles so fetch tiers are refreshed at their own pace
+        lambda cycle: run_once(run_id=first_run_id + cycle * configs.run_every),
+        cycles=configs.soak_test_cycles,
+        max_growth=configs.soak_test_max_growth,
+    )
+
+    if not passed:
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
-    run()
+    if configs.soak_test_cycles:
+        soak()
+    else:
+        configs.connect()
+        run()
@@ -1,79 +1,97 @@
+import datetime
 import logging
 
 from tinydb import TinyDB, Query
+from tinydb.storages import MemoryStorage
 
 logger = logging.getLogger()
 
 
+def match_event(gcal_id, event_id, event_index):
+    event = Query()
+
+    # Entries saved before they were told apart by calendar are claimed by the first calendar syncing them
+    return (
+        (event.event_id == event_id)
+        & (event.event_index == event_index)
+        & ((event.gcal_id == gcal_id) | ~event.gcal_id.exists())
+    )
+
+
 class DB:
-    def __init__(self):
-        self.db: TinyDB = TinyDB("db/events.json")
+    def __init__(self, in_memory: bool = False):
+        if in_memory:
+            self.db: TinyDB = TinyDB(storage=MemoryStorage)
+        else:
+            self.db: TinyDB = TinyDB("db/events.json")
+
+        self.backfill = self.db.table("backfill")
+        self.fetch_tiers = self.db.table("fetch_tiers")
+
+    def clear_cache(self):
+        self.db.clear_cache()
+        self.backfill.clear_cache()
+        self.fetch_tiers.clear_cache()
 
     def insert_or_update_without_todoist(
         self,
+        gcal_id,
         event_id,
         due_date,
         event_index,
         run_id,
     ):
-        event = Query()
-
         self.db.upsert(
             {
+                "gcal_id": gcal_id,
                 "event_id": event_id,
                 "due_date": str(due_date),
                 "event_index": event_index,
                 "run_id": run_id,
             },
-            ((event.event_id == event_id) & (event.event_index == event_index)),
+            match_event(gcal_id=gcal_id, event_id=event_id, event_index=event_index),
         )
 
     def insert_or_update_with_todoist(
         self,
+        gcal_id,
         event_id,
         due_date,
         event_index,
         run_id,
         todoist_id,
     ):
-        event = Query()
-
         self.db.upsert(
             {
+                "gcal_id": gcal_id,
                 "event_id": event_id,
                 "due_date": str(due_date),
                 "event_index": event_index,
                 "run_id": run_id,
                 "todoist_id": todoist_id,
             },
-            ((event.event_id == event_id) & (event.event_index == event_index)),
+            match_event(gcal_id=gcal_id, event_id=event_id, event_index=event_index),
         )
 
-    def update_todoist_id(self, todoist_id, event_id, event_index):
-        event = Query()
-
+    def update_todoist_id(self, todoist_id, gcal_id, event_id, event_index):
         self.db.update(
             {
                 "todoist_id": todoist_id,
             },
-            ((event.event_id == event_id) & (event.event_index == event_index)),
+            match_event(gcal_id=gcal_id, event_id=event_id, event_index=event_index),
         )
 
-    def update_todoist_status(self, completed: bool, event_id, event_index):
-        event = Query()
-
+    def update_todoist_status(self, completed: bool, gcal_id, event_id, event_index):
         self.db.update(
             {
                 "completed": completed,
             },
-            ((event.event_id == event_id) & (event.event_index == event_index)),
+            match_event(gcal_id=gcal_id, event_id=event_id, event_index=event_index),
         )
 
-    def get_event(self, event_id, event_index):
-        event = Query()
-
+    def get_event(self, gcal_id, event_id, event_index):
         return self.db.get(
-            ((event.event_id == event_id) & (event.event_index == event_index))
+            match_event(gcal_id=gcal_id, event_id=event_id, event_index=event_index)
         )
 
     def get_unattached_events(self, run_id):
@@ -85,3 +103,53 @@ class DB:
         event = Query()
 
         return self.db.remove(doc_ids=[doc_id])
+
+    def get_backfill_checkpoint(self, gcal_id):
+        checkpoint = Query()
+
+        entry = self.backfill.get(checkpoint.gcal_id == gcal_id)
+
+        return datetime.date.fromisoformat(entry["synced_until"]) if entry else None
+
+    def get_backfill_checkpoints(self):
+        return [
+            datetime.date.fromisoformat(entry["synced_until"])
+            for entry in self.backfill.all()
+        ]
+
+    def delete_backfill_checkpoints(self, excluding_gcal_ids):
+        checkpoint = Query()
+
+        return self.backfill.remove(~checkpoint.gcal_id.one_of(excluding_gcal_ids))
+
+    def set_backfill_checkpoint(self, gcal_id, synced_until):
+        checkpoint = Query()
+
+        self.backfill.upsert(
+            {
+                "gcal_id": gcal_id,
+                "synced_until": str(synced_until),
+            },
+            (checkpoint.gcal_id == gcal_id),
+        )
+
+    def get_tier_refresh(self, start_day, end_day):
+        tier = Query()
+
+        entry = self.fetch_tiers.get(
+            (tier.start_day == start_day) & (tier.end_day == end_day)
+        )
+
+        return entry["last_refresh"] if entry else None
+
+    def set_tier_refresh(self, start_day, end_day, last_refresh):
+        tier = Query()
+
+        self.fetch_tiers.upsert(
+            {
+                "start_day": start_day,
+                "end_day": end_day,
+                "last_refresh": last_refresh,
+            },
+            ((tier.start_day == start_day) & (tier.end_day == end_day)),
+        )
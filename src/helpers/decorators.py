@@ -1,6 +1,7 @@
 import functools
 import logging
-from time import sleep
+from collections import deque
+from time import monotonic, sleep
 
 logger = logging.getLogger()
 
@@ -55,3 +56,38 @@ def keep_running(delay: int, one_shot: bool = False):
         return wrapper
 
     return decorator
+
+
+class RequestBudget:
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.requests = deque()
+
+    def wait(self) -> None:
+        """Block until a request fits in the budget of the last 60 seconds and record it"""
+
+        if not self.requests_per_minute:
+            return
+
+        while self.requests and monotonic() - self.requests[0] >= 60:
+            self.requests.popleft()
+
+        if len(self.requests) >= self.requests_per_minute:
+            wait = 60 - (monotonic() - self.requests.popleft())
+            if wait > 0:
+                logger.info(f"Request budget spent, waiting {wait:.0f} seconds")
+                sleep(wait)
+
+        self.requests.append(monotonic())
+
+
+def throttle(budget: RequestBudget):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            budget.wait()
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
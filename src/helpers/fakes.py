@@ -0,0 +1,240 @@
+"""In-memory stand-ins for the Todoist and Google Calendar APIs, used by the soak test"""
+
+import datetime
+import itertools
+from types import SimpleNamespace
+
+from todoist_api_python.models import Due
+
+from todoist_api_override.api import Duration, TaskPatched
+
+
+class FakeTodoistAPI:
+    def __init__(
+        self,
+        mother_project_name: str,
+        completed_label: str,
+        calendars: int = 3,
+        complete_every: int = 7,
+    ):
+        self.ids = itertools.count(1)
+        self.completed_label = completed_label
+        self.complete_every = complete_every
+        self.task_requests = 0
+
+        self.projects = []
+        self.comments = {}
+        self.tasks = {}
+
+        mother_project = self.add_project(mother_project_name)
+        for index in range(calendars):
+            project = self.add_project(f"Calendar {index}", parent_id=mother_project.id)
+            self.add_comment(
+                project_id=project.id, content=f"calendar{index}@example.com"
+            )
+
+    def add_project(self, name: str, parent_id: str = None) -> SimpleNamespace:
+        project = SimpleNamespace(
+            id=str(next(self.ids)), name=name, parent_id=parent_id, comment_count=0
+        )
+        self.projects.append(project)
+        return project
+
+    def add_comment(self, project_id: str, content: str) -> None:
+        self.comments.setdefault(project_id, []).append(
+            SimpleNamespace(content=content)
+        )
+        for project in self.projects:
+            if project.id == project_id:
+                project.comment_count += 1
+
+    def get_projects(self) -> list[SimpleNamespace]:
+        return list(self.projects)
+
+    def get_comments(self, project_id: str) -> list[SimpleNamespace]:
+        return list(self.comments.get(project_id, []))
+
+    def get_tasks(self, project_id: str) -> list[TaskPatched]:
+        """Return the open tasks of a project, labeling one as completed every complete_every requests"""
+
+        tasks = [
+            task
+            for task in self.tasks.values()
+            if task.project_id == project_id and not task.is_completed
+        ]
+
+        self.task_requests += 1
+        if tasks and self.task_requests % self.complete_every == 0:
+            tasks[0].labels = tasks[0].labels + [self.completed_label]
+
+        return tasks
+
+    def add_task(self, content: str, **kwargs) -> TaskPatched:
+        task = TaskPatched(
+            assignee_id=None,
+            assigner_id=None,
+            comment_count=0,
+            is_completed=False,
+            content=content,
+            created_at=str(datetime.datetime.now()),
+            creator_id="0",
+            description="",
+            due=None,
+            id=str(next(self.ids)),
+            labels=[],
+            order=0,
+            parent_id=None,
+            priority=1,
+            project_id="",
+            section_id=None,
+            url="",
+            duration=None,
+        )
+        self.tasks[task.id] = task
+        self.update_task(task_id=task.id, **kwargs)
+        return task
+
+    def update_task(self, task_id: str, **kwargs) -> None:
+        task = self.tasks[task_id]
+
+        task.content = kwargs.get("content", task.content)
+        task.description = kwargs.get("description", task.description)
+        task.project_id = kwargs.get("project_id", task.project_id)
+        task.labels = kwargs.get("labels", task.labels)
+
+        due = kwargs.get("due_date") or kwargs.get("due_datetime")
+        if due:
+            task.due = Due(date=due, is_recurring=False, string=due)
+        if kwargs.get("duration"):
+            task.duration = Duration(
+                amount=kwargs["duration"], unit=kwargs["duration_unit"]
+            )
+
+    def close_task(self, task_id: str) -> None:
+        self.tasks[task_id].is_completed = True
+
+    def delete_task(self, task_id: str) -> None:
+        self.tasks.pop(task_id, None)
+
+
+class FakeGoogleCalendar:
+    def __init__(
+        self,
+        calendars: int = 3,
+        events_per_day: int = 4,
+        page_size: int = 25,
+        shared_responses: tuple = ("accepted", "tentative", "declined"),
+    ):
+        self.calendars = calendars
+        self.events_per_day = events_per_day
+        self.shared_responses = shared_responses
+        self.page_size = page_size
+        self.fetches = 0
+
+        # Stands in for the googleapiclient resource, as in service.events().list()
+        self.service = self
+
+    def get_events_json(
+        self,
+        calendar_id: str,
+        time_min: datetime.datetime,
+        time_max: datetime.datetime,
+    ) -> list[dict]:
+        """Build the events of every day of the window, replacing some of them on each fetch"""
+
+        events = []
+
+        day = time_min.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < time_max:
+            for slot in range(self.events_per_day):
+                # The last slot gets a new event on every fetch so tasks are also added and deleted
+                generation = self.fetches if slot == self.events_per_day - 1 else 0
+                # The second slot is edited every few fetches so tasks are also updated
+                revision = self.fetches // 5 if slot == 1 else 0
+                event_id = f"{calendar_id}{day:%Y%m%d}{slot}{generation}"
+                start = day.replace(hour=8 + slot * 2).astimezone(datetime.timezone.utc)
+                end = start + datetime.timedelta(hours=1)
+
+                # Like the API, only list events overlapping the window
+                if end <= time_min or start >= time_max:
+                    continue
+
+                # The first slot is a meeting shared by every calendar
+                # with the same id on every calendar and each calendar answering differently
+                if slot == 0:
+                    event_id = f"{day:%Y%m%d}{slot}"
+                    ical_uid = f"{event_id}@example.com"
+                    summary = f"Meeting {day:%Y%m%d}"
+                    attendees = [
+                        {
+                            "email": f"calendar{index}@example.com",
+                            "responseStatus": self.shared_responses[
+                                index % len(self.shared_responses)
+                            ],
+                        }
+                        for index in range(self.calendars)
+                    ]
+                else:
+                    ical_uid = f"{event_id}@example.com"
+                    summary = f"Event {event_id} v{revision}"
+                    attendees = [
+                        {
+                            "email": calendar_id,
+                            "displayName": "Attendee",
+                            "responseStatus": "accepted",
+                        }
+                    ]
+
+                attendees.append(
+                    {"email": "shared@example.com", "responseStatus": "needsAction"}
+                )
+
+                events.append(
+                    {
+                        "id": event_id,
+                        "iCalUID": ical_uid,
+                        "updated": (
+                            day.astimezone(datetime.timezone.utc)
+                            + datetime.timedelta(minutes=revision)
+                        ).isoformat(),
+                        "summary": summary,
+                        "description": f"<p>Description of <b>{summary}</b></p>",
+                        "location": "Meeting room",
+                        "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+                        "end": {"dateTime": end.isoformat(), "timeZone": "UTC"},
+                        "attendees": attendees,
+                    }
+                )
+
+            day += datetime.timedelta(days=1)
+
+        return events
+
+    def events(self) -> "FakeGoogleCalendar":
+        return self
+
+    def list(
+        self,
+        calendarId: str,
+        timeMin: str,
+        timeMax: str,
+        pageToken: str | None = None,
+        **kwargs,
+    ) -> SimpleNamespace:
+        """Return a request listing a page of events, like events().list() does"""
+
+        first = int(pageToken) if pageToken else 0
+        if not first:
+            self.fetches += 1
+
+        items = self.get_events_json(
+            calendar_id=calendarId,
+            time_min=datetime.datetime.fromisoformat(timeMin),
+            time_max=datetime.datetime.fromisoformat(timeMax),
+        )
+
+        response = {"items": items[first : first + self.page_size]}
+        if first + self.page_size < len(items):
+            response["nextPageToken"] = str(first + self.page_size)
+
+        return SimpleNamespace(execute=lambda: response)
@@ -0,0 +1,101 @@
+import gc
+import logging
+import tracemalloc
+from typing import Callable
+
+logger = logging.getLogger()
+
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def log_growth(
+    old_snapshot: tracemalloc.Snapshot, new_snapshot: tracemalloc.Snapshot, top: int
+) -> None:
+    """Log the allocations that grew the most between two snapshots"""
+
+    for stat in new_snapshot.compare_to(old_snapshot, "lineno")[:top]:
+        if stat.size_diff <= 0:
+            break
+
+        logger.info(f"- {stat}")
+
+
+class MemoryMonitor:
+    def __init__(self, snapshot_every: int, top: int = 10):
+        self.snapshot_every = snapshot_every
+        self.top = top
+
+        self.runs = 0
+        self.last_snapshot = None
+
+        if self.snapshot_every and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def after_run(self) -> None:
+        """Take a snapshot every snapshot_every runs and log the growth since the last one"""
+
+        if not self.snapshot_every:
+            return
+
+        self.runs += 1
+        if self.runs % self.snapshot_every:
+            return
+
+        snapshot = take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        logger.info(
+            f"Memory after {self.runs} runs: {current / 1024:.1f} KiB "
+            f"(peak {peak / 1024:.1f} KiB)"
+        )
+
+        if self.last_snapshot:
+            logger.info(f"Top allocation growth in the last {self.snapshot_every} runs")
+            log_growth(self.last_snapshot, snapshot, top=self.top)
+
+        self.last_snapshot = snapshot
+
+
+def soak_test(
+    func: Callable[[int], None], cycles: int, max_growth: float, top: int = 10
+) -> bool:
+    """Call func for the given number of cycles and check that the memory it holds on to stays under max_growth MiB"""
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    warmup = max(cycles // 10, 1)  # Let caches and lazy imports settle first
+    baseline = None
+    baseline_snapshot = None
+
+    for cycle in range(cycles):
+        func(cycle)
+
+        if cycle + 1 == warmup:
+            gc.collect()
+            baseline, _ = tracemalloc.get_traced_memory()
+            baseline_snapshot = take_snapshot()
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    growth = (current - baseline) / 1024 / 1024
+
+    logger.info(
+        f"Soak test: {cycles} cycles, grew {growth:.2f} MiB after {warmup} warm-up cycles "
+        f"(peak {peak / 1024 / 1024:.2f} MiB)"
+    )
+    log_growth(baseline_snapshot, take_snapshot(), top=top)
+
+    if growth > max_growth:
+        logger.error(f"Soak test failed: memory grew over {max_growth} MiB")
+        return False
+
+    return True